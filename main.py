@@ -1,21 +1,28 @@
+import os
 import sys
+import queue
 import logging
 import re
 import json
+import time
+from functools import lru_cache
+from operator import itemgetter
+from logging.handlers import QueueHandler, QueueListener
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QObject
-from PyQt5.QtGui import QFont
+from PyQt5.QtCore import Qt, QTimer, QThreadPool, QRunnable, pyqtSignal, QObject, QAbstractTableModel, QModelIndex
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
-    QLineEdit, QPushButton, QComboBox, QTableWidget, QTableWidgetItem,
+    QLineEdit, QPushButton, QComboBox, QTableView, QHeaderView,
     QMessageBox, QSplitter, QProgressBar, QDialog, QDialogButtonBox,
-    QFormLayout, QSpinBox
+    QFormLayout, QSpinBox, QCheckBox
 )
-from metrc_api import get_package_id, get_test_results, PREFIXES
+from metrc_api import get_package_with_tests, invalidate, configure_logging, build_full_label, CACHE_TTL, MAX_LOOKUP_THREADS
+
+# Handlers (debug.log and console) are attached to the root logger by configure_logging()
+logger = logging.getLogger("barkeep")
 
 # **Define Individual Cannabinoids**
-INDIVIDUAL_CANNABINOIDS = [
+INDIVIDUAL_CANNABINOIDS = (
     "Δ9-THC",
     "THCA",
     "CBD",
@@ -24,10 +31,10 @@ INDIVIDUAL_CANNABINOIDS = [
     "THCV",
     "CBDV",
     "Δ8-THC"
-]
+)
 
 # **Define All Cannabinoid Test Types (Including Aggregated)**
-CANNABINOID_TEST_TYPES = [
+CANNABINOID_TEST_TYPES = (
     "Δ9-THC", "THCA", "CBD", "CBDA", "TOTAL THC", "CBN", "THCV", "CBDV", "Δ8-THC", "TOTAL CBD",
     "Total CBD (mg/serving) Mandatory Cannabinoid % and Totals",
     "Total CBD (mg/unit) Raw Plant Material & Prerolls",
@@ -40,53 +47,414 @@ CANNABINOID_TEST_TYPES = [
     "Total Delta-9 THC (mg/unit) Raw Plant Material & PreRolls",
     "Delta-9 THC (%) Mandatory Cannabinoid % and Totals",
     "Total Delta-9 THC (%) Mandatory Cannabinoid % and Totals",
-]
+)
 
-TERPENE_TEST_TYPES = [
+TERPENE_TEST_TYPES = (
     "Myrcene", "Beta-Caryophyllene", "Alpha-Pinene", "Beta-Pinene", "Limonene", "Linalool",
     "Terpinolene", "Humulene", "Ocimene", "Geraniol", "Eucalyptol", "Camphene", "Borneol",
     "Delta-3-Carene", "Terpineol", "Farnesene", "Guaiol", "Isopulegol", "Nerolidol"
-]
+)
+
+def compile_substring_matcher(needles):
+    """
+    Compiles the needles into a single alternation so each name is scanned once
+    by the regex engine instead of once per needle in Python. Needles that
+    contain another needle can never change the outcome of a substring test
+    and are dropped. With none left as a prefix of another, branch order does
+    not affect the result, so the short, common abbreviations are tried first.
+    """
+    needles = set(needles)
+    needles = [
+        needle for needle in needles
+        if not any(other != needle and other in needle for other in needles)
+    ]
+    return re.compile("|".join(re.escape(needle) for needle in sorted(needles, key=lambda needle: (len(needle), needle))))
+
+CANNABINOID_PATTERN = compile_substring_matcher(CANNABINOID_TEST_TYPES)
+TERPENE_PATTERN = compile_substring_matcher(TERPENE_TEST_TYPES)
+
+# Names METRC reports verbatim hit these sets before any substring scan
+CANNABINOID_NAMES = frozenset(CANNABINOID_TEST_TYPES)
+# Exact-match membership; INDIVIDUAL_CANNABINOIDS keeps the export column order
+INDIVIDUAL_CANNABINOID_NAMES = frozenset(INDIVIDUAL_CANNABINOIDS)
+TERPENE_NAMES = frozenset(TERPENE_TEST_TYPES)
+
+# METRC reuses a small set of test type names, so each name is classified once
+@lru_cache(maxsize=512)
+def is_cannabinoid_test(test_type):
+    return test_type in CANNABINOID_NAMES or CANNABINOID_PATTERN.search(test_type) is not None
+
+@lru_cache(maxsize=512)
+def is_terpene_test(test_type):
+    return test_type in TERPENE_NAMES or TERPENE_PATTERN.search(test_type) is not None
+
+def classify_test_results(results):
+    """
+    Splits the raw lab test results into cannabinoid and terpene rows in a
+    single pass. Also returns the first reported test date, or "N/A" if no
+    record has one. Expects result records (dicts) only.
+    """
+    cannabinoid_results = []
+    terpene_results = []
+    test_date = "N/A"
+    for result in results:
+        if test_date == "N/A":
+            test_date = result.get("TestPerformedDate", "N/A")
+        test_type = result.get("TestTypeName", "")
+        if is_cannabinoid_test(test_type):
+            cannabinoid_results.append(result)
+        if is_terpene_test(test_type):
+            terpene_results.append(result)
+    return cannabinoid_results, terpene_results, test_date
+
+# ASCII digits only; str.isdigit() also accepts characters such as superscripts
+PARTIAL_TAG_PATTERN = re.compile(r"[0-9]+")
+
+UNITS_PATTERN = re.compile(r"\(([^)]*)\)")
+# Parenthesized units and any whitespace before them, removed from display names
+PARENTHESIZED_PATTERN = re.compile(r"\s*\([^)]*\)")
+
+@lru_cache(maxsize=256)
+def extract_units(test_type):
+    """
+    Returns the unit in parentheses in a test type name (e.g. "%" or "mg/unit"),
+    or "" if there is none. The set of distinct test names is small, so parses
+    are cached.
+    """
+    unit_match = UNITS_PATTERN.search(test_type)
+    return unit_match.group(1) if unit_match else ""
+
+# Product category suffixes METRC appends to cannabinoid test names
+CANNABINOID_SUFFIX_PATTERN = re.compile("|".join(re.escape(suffix) for suffix in (
+    "Raw Plant Material & PreRolls",
+    "Mandatory Cannabinoid % and Totals",
+    "Vapes & Concentrates",
+    "Infused Plant Material & PreRolls",
+)))
+
+@lru_cache(maxsize=256)
+def simplify_cannabinoid_name(test_type):
+    """
+    Strips the product category suffixes from a cannabinoid test name for display.
+    """
+    return CANNABINOID_SUFFIX_PATTERN.sub("", test_type).strip()
+
+def format_cannabinoid_result(test_type, test_result):
+    """
+    Returns the result level with the unit from the test name appended, if any.
+    """
+    units = extract_units(test_type)
+    if units and test_result != "N/A":
+        return f"{test_result} {units}"
+    return str(test_result)
+
+# Replacements applied to terpene test names for display, in a single regex pass
+TERPENE_NAME_SUBSTITUTIONS = {"Mandatory Terpenes": "", "Alpha-": "a-", "Beta-": "b-"}
+TERPENE_NAME_PATTERN = re.compile("|".join(re.escape(old) for old in TERPENE_NAME_SUBSTITUTIONS))
+
+@lru_cache(maxsize=256)
+def terpene_display_name(test_type):
+    """
+    Shortens a terpene test name for the table (e.g. "Beta-Pinene (%)" -> "b-Pinene").
+    """
+    display_name = PARENTHESIZED_PATTERN.sub("", test_type)
+    display_name = TERPENE_NAME_PATTERN.sub(lambda match: TERPENE_NAME_SUBSTITUTIONS[match.group(0)], display_name)
+    return display_name.strip()
+
+@lru_cache(maxsize=256)
+def terpene_export_name(test_type):
+    """
+    Cleans a terpene test name for the export, keeping the full Alpha-/Beta- prefix.
+    """
+    return PARENTHESIZED_PATTERN.sub("", test_type).replace("Mandatory Terpenes", "").strip()
+
+def format_terpene_concentration(test_type, concentration):
+    """
+    Returns the concentration rounded to the nearest hundredth as a percentage,
+    or the raw value when it is not numeric.
+    """
+    if isinstance(concentration, str):
+        if concentration.lower() != "n/a":
+            try:
+                return f"{round(float(concentration), 2)}%"
+            except ValueError:
+                return str(concentration)
+        return str(concentration)
+    elif isinstance(concentration, (int, float)):
+        return f"{round(concentration, 2)}%"
+    return "N/A"
+
+# Fields projected from each lab result record, with the defaults for missing keys
+RESULT_FIELDS = ("TestTypeName", "TestPassed", "TestResultLevel", "TestPerformedDate")
+RESULT_DEFAULTS = ("N/A", False, "N/A", "N/A")
+
+def build_result_rows(results, display_name, display_value):
+    """
+    Returns one (name, status, value, date) display row per result.
+    display_name maps the raw test type name to the name shown, and
+    display_value maps (test type name, result level) to the value shown.
+    """
+    rows = []
+    append_row = rows.append
+    for result in results:
+        test_type, passed, level, test_date = map(result.get, RESULT_FIELDS, RESULT_DEFAULTS)
+        append_row((
+            display_name(test_type),
+            "Passed" if passed else "Failed",
+            display_value(test_type, level),
+            test_date,
+        ))
+    return rows
+
+def select_terpenes(terpene_results):
+    """
+    Drops terpenes with no reported or zero concentration and sorts the rest
+    by descending concentration.
+    """
+    final_results = []
+    for r in terpene_results:
+        concentration = r.get("TestResultLevel", "N/A")
+        if isinstance(concentration, str):
+            if concentration.lower() == "n/a":
+                continue
+            try:
+                value = float(concentration)
+            except ValueError:
+                value = 0.0  # Keep unparseable levels, sorted with the lowest
+            else:
+                if value == 0.0:
+                    continue  # skip zero values
+        elif isinstance(concentration, (int, float)):
+            if concentration == 0:
+                continue
+            value = float(concentration)
+        else:
+            continue
+        final_results.append((value, r))
+
+    # Each level is parsed once above, so sorting only compares floats
+    final_results.sort(key=itemgetter(0), reverse=True)
+    return [r for _, r in final_results]
+
+def extract_cannabinoid_values(results):
+    cannabinoid_values = {cannabinoid: "0.0" for cannabinoid in INDIVIDUAL_CANNABINOIDS}
+
+    for r in results:
+        test_type = r.get("TestTypeName", "")
+        if test_type not in INDIVIDUAL_CANNABINOID_NAMES:
+            continue  # Aggregates and totals are shown in the table only
+        result_level = r.get("TestResultLevel", "N/A")
+        units = extract_units(test_type)
+
+        if isinstance(result_level, str):
+            if result_level.lower() != "n/a":
+                try:
+                    value = float(result_level)
+                    if value > 0:
+                        cannabinoid_values[test_type] = f"{round(value, 2)}{units}" if units else f"{round(value, 2)}"
+                    else:
+                        cannabinoid_values[test_type] = "0.0"
+                except ValueError:
+                    cannabinoid_values[test_type] = result_level
+        elif isinstance(result_level, (int, float)):
+            if result_level > 0:
+                cannabinoid_values[test_type] = f"{round(result_level, 2)}{units}" if units else f"{round(result_level, 2)}"
+            else:
+                cannabinoid_values[test_type] = "0.0"
+        else:
+            cannabinoid_values[test_type] = "0.0"
+
+    return cannabinoid_values
+
+def validate_test_date(date_str):
+    if date_str == "N/A":
+        return "N/A"
+    try:
+        datetime.strptime(date_str, "%Y-%m-%d")
+        return date_str
+    except (TypeError, ValueError):
+        return "N/A"
+
+def add_one_year(date_str):
+    """
+    Returns the date one year after a YYYY-MM-DD date, formatted MM/DD/YYYY.
+    """
+    date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+    try:
+        new_date = date_obj.replace(year=date_obj.year + 1)
+    except ValueError:
+        new_date = date_obj.replace(year=date_obj.year + 1, day=28)  # Feb 29 -> Feb 28
+    return new_date.strftime("%m/%d/%Y")  # Change to MM/DD/YYYY format, no timestamp
+
+def prepare_test_results(test_results):
+    """
+    Classifies the raw lab results and builds everything the window shows or
+    exports from them. Runs on the worker thread so the UI thread only has to
+    hand the finished rows to the table models.
+    """
+    # Validate the payload once here; everything below assumes result records
+    test_results = [result for result in test_results if isinstance(result, dict)]
+    cannabinoid_results, terpene_results, test_date = classify_test_results(test_results)
+    terpenes = select_terpenes(terpene_results)
+    terpene_rows = build_result_rows(terpenes, terpene_display_name, format_terpene_concentration)
+    return {
+        "has_results": bool(test_results),
+        "cannabinoid_rows": build_result_rows(cannabinoid_results, simplify_cannabinoid_name, format_cannabinoid_result),
+        "terpene_rows": terpene_rows,
+        # Export entries reuse the concentration strings formatted for the table
+        "terpene_export": [
+            {"Name": terpene_export_name(terpene.get("TestTypeName", "N/A")), "Concentration": row[2]}
+            for terpene, row in zip(terpenes, terpene_rows)
+        ],
+        "test_date": validate_test_date(test_date),
+        # Every individual cannabinoid name is a cannabinoid test type
+        "cannabinoid_values": extract_cannabinoid_values(cannabinoid_results),
+    }
+
+def write_export_file(filename, export_data, cannabinoid_values, terpenes):
+    """
+    Fills in the cannabinoid and terpene sections of export_data and writes
+    it as JSON for Bartender. Runs on a worker thread with snapshots of the
+    window's results, so it never touches widget state.
+    """
+    # **Add the cannabinoid values to the dictionary**
+    for cannabinoid in INDIVIDUAL_CANNABINOIDS:
+        value = cannabinoid_values.get(cannabinoid, "0.0")
+        export_data["Cannabinoids"][cannabinoid] = value
+
+    # **Terpenes were formatted and sorted when the results were prepared**
+    export_data["Terpenes"] = terpenes if terpenes else "N/A"
+
+    # **Write the data to a JSON file**
+    # Serialize up front so the file is written in one call rather than
+    # one small write per token as json.dump does
+    contents = json.dumps(export_data, ensure_ascii=False, indent=4)
+    with open(filename, "w", encoding="utf-8") as jsonfile:
+        jsonfile.write(contents)
+
+    logger.info("Exported results to %s. Bartender can now use this file.", filename)
+
+# Quiet period before a search starts, so repeated Enter presses make one request
+SEARCH_DEBOUNCE_MS = 250
+
+# Application stylesheet, kept next to this file
+STYLESHEET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "barkeep.qss")
+
+# Rows measured when fitting table columns to their contents
+RESIZE_SAMPLE_ROWS = 50
 
 UNIT_WEIGHTS = {
     "MAN000035": ["0.5g", "1g", "2g", "3.5g", "100mg", "250mg", "500mg"],
     "CUL000032": ["1g", "3.5g", "7g", "14g", "28g", "448g"]
 }
 
+# Maps API error messages to (dialog function, title, message template)
+ERROR_DIALOGS = {
+    "Unauthorized": (
+        QMessageBox.critical,
+        "Authentication Error",
+        "Unauthorized access when fetching {context}. Check API credentials.",
+    ),
+    "packageId not found": (
+        QMessageBox.warning,
+        "Not Found",
+        "Package ID not found when fetching {context}.",
+    ),
+}
+DEFAULT_ERROR_DIALOG = (QMessageBox.warning, "API Error", "Failed to retrieve {context}: {error}")
+
 # Worker class definition
-class Worker(QObject):
-    finished = pyqtSignal(dict)        
-    error = pyqtSignal(str, str)       
-    test_results_ready = pyqtSignal(list, dict)
+class WorkerSignals(QObject):
+    finished = pyqtSignal(dict)
+    error = pyqtSignal(str, str)
+    test_results_ready = pyqtSignal(dict, dict)
 
-    def __init__(self, license_code, full_label, parent=None):
-        super().__init__(parent)
+class Worker(QRunnable):
+    def __init__(self, license_code, full_label, refresh=False):
+        super().__init__()
+        self.signals = WorkerSignals()
         self.license_code = license_code
         self.full_label = full_label
+        self.refresh = refresh
 
     def run(self):
-        package_response = get_package_id(self.license_code, self.full_label)
-        if not package_response["success"]:
-            self.error.emit(package_response.get("error", "Unknown error"), "package details")
+        # Always report back so the window can re-enable searching
+        try:
+            self.lookup()
+        except Exception as e:
+            logger.exception("Lookup for %s failed", self.full_label)
+            self.signals.error.emit(str(e), "METRC data")
+
+    def lookup(self):
+        response = get_package_with_tests(self.license_code, self.full_label, refresh=self.refresh)
+        if not response["success"]:
+            context = "package details" if response.get("failed") == "package" else "test results"
+            self.signals.error.emit(response.get("error", "Unknown error"), context)
             return
 
-        package_id = package_response["package_id"]
+        package_response = response["package"]
         product_name = package_response.get("product_name", self.full_label)
         source_package_label = package_response.get("source_package_label", "N/A")
 
-        test_response = get_test_results(self.license_code, package_id)
-        if not test_response["success"]:
-            self.error.emit(test_response.get("error", "Unknown error"), "test results")
-            return
-
-        test_results = test_response["data"]
+        results = prepare_test_results(response["test_results"]["data"])
         package_info = {
             "product_name": product_name,
             "source_package_label": source_package_label,
             "full_label": self.full_label  # Added FullPackageTag
         }
-        self.test_results_ready.emit(test_results, package_info)
-        self.finished.emit({"success": True})
+        self.signals.test_results_ready.emit(results, package_info)
+        self.signals.finished.emit({"success": True})
+
+class ExportWorker(QRunnable):
+    def __init__(self, filename, export_data, cannabinoid_values, terpenes):
+        super().__init__()
+        self.signals = WorkerSignals()
+        self.filename = filename
+        self.export_data = export_data
+        self.cannabinoid_values = cannabinoid_values
+        self.terpenes = terpenes
+
+    def run(self):
+        try:
+            write_export_file(self.filename, self.export_data, self.cannabinoid_values, self.terpenes)
+        except Exception as e:
+            # Always report back so the window can re-enable exporting
+            logger.exception("Export to %s failed", self.filename)
+            self.signals.error.emit(str(e), self.filename)
+            return
+        self.signals.finished.emit({"success": True, "filename": self.filename})
+
+# TestResultsModel class definition
+class TestResultsModel(QAbstractTableModel):
+    """
+    Read-only model over pre-formatted result rows. The view asks for the cells
+    it paints instead of the table owning an item object per cell.
+    """
+    def __init__(self, headers, parent=None):
+        super().__init__(parent)
+        self.headers = headers
+        self.rows = []
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and index.isValid():
+            return self.rows[index.row()][index.column()]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        return super().headerData(section, orientation, role)
 
 # UnitWeightDialog class definition
 class UnitWeightDialog(QDialog):
@@ -120,23 +488,21 @@ class MetrcApp(QWidget):
         self.setWindowTitle("Barkeep by Grissom")
         self.resize(1500, 1000)  # Increased size for better visibility
 
-        input_font = QFont()
-        input_font.setPointSize(12)
-
         logo_label = QLabel("RobustMo")
 
         self.license_label = QLabel("Select License:")
         self.license_combo = QComboBox()
         self.license_combo.addItems(["MAN000035", "CUL000032"])
-        self.license_combo.setFont(input_font)
 
         self.tag_label = QLabel("Enter Partial Tag:")
         self.tag_input = QLineEdit()
         self.tag_input.setPlaceholderText("e.g., 23570 for MAN000035")
-        self.tag_input.setFont(input_font)
         self.tag_input.returnPressed.connect(self.search_test_results)  # Connect to search_test_results
 
         self.search_button = QPushButton("Search")
+        self.refresh_checkbox = QCheckBox("Force refresh")
+        self.refresh_checkbox.setToolTip("Skip cached results. Shift+Enter does the same for a single search.")
+        self.clear_cache_button = QPushButton("Clear Cache")
 
         self.status_label = QLabel("")
         self.expiration_label = QLabel("Expiration Date: N/A")
@@ -146,21 +512,8 @@ class MetrcApp(QWidget):
         self.progress_bar.setVisible(False)
         self.progress_bar.setTextVisible(False)
 
-        self.cannabinoids_table = QTableWidget()
-        self.cannabinoids_table.setColumnCount(4)
-        self.cannabinoids_table.setHorizontalHeaderLabels(["Test Type", "Status", "Result", "Date"])
-        self.cannabinoids_table.horizontalHeader().setStretchLastSection(True)
-        self.cannabinoids_table.setEditTriggers(QTableWidget.NoEditTriggers)
-        self.cannabinoids_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.cannabinoids_table.setAlternatingRowColors(True)
-
-        self.terpenes_table = QTableWidget()
-        self.terpenes_table.setColumnCount(4)
-        self.terpenes_table.setHorizontalHeaderLabels(["Terpene", "Status", "Concentration", "Date"])
-        self.terpenes_table.horizontalHeader().setStretchLastSection(True)
-        self.terpenes_table.setEditTriggers(QTableWidget.NoEditTriggers)
-        self.terpenes_table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.terpenes_table.setAlternatingRowColors(True)
+        self.cannabinoids_table = self.create_results_table(["Test Type", "Status", "Result", "Date"])
+        self.terpenes_table = self.create_results_table(["Terpene", "Status", "Concentration", "Date"])
 
         top_layout = QHBoxLayout()
         top_layout.addWidget(logo_label)
@@ -172,8 +525,11 @@ class MetrcApp(QWidget):
         input_layout.addWidget(self.tag_label)
         input_layout.addWidget(self.tag_input)
         input_layout.addWidget(self.search_button)
+        input_layout.addWidget(self.refresh_checkbox)
+        input_layout.addWidget(self.clear_cache_button)
 
         self.search_button.clicked.connect(self.search_test_results)
+        self.clear_cache_button.clicked.connect(self.clear_cache)
 
         cannabinoids_layout = QVBoxLayout()
         cannabinoids_label = QLabel("Cannabinoid Test Results")
@@ -221,7 +577,16 @@ class MetrcApp(QWidget):
 
         self.setLayout(main_layout)
 
-        self.thread = None
+        self.thread_pool = QThreadPool.globalInstance()
+        # Lookups are network-bound; metrc_api sizes its connection pool from the same cap
+        self.thread_pool.setMaxThreadCount(MAX_LOOKUP_THREADS)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self._force_refresh = False
+        self._search_queued = False
 
         self.product_name = "Unknown Product"
         self.test_date = "N/A"
@@ -236,132 +601,157 @@ class MetrcApp(QWidget):
         self.license_selected = "N/A"        # **New Variable for LicenseSelected**
 
         self.terpenes_data = []
+        # Whether the tables currently show results that can be exported
+        self._results_loaded = False
+
+        # Last completed query, so an unchanged re-search skips the worker entirely
+        self._pending_query = None
+        self._last_query = None
+        self._last_results = None
+        self._last_results_time = 0.0
 
         self.cannabinoid_values = {cannabinoid: "0.0" for cannabinoid in INDIVIDUAL_CANNABINOIDS}
 
-        self.setStyleSheet("""
-            QWidget {
-                background-color: #f7f7f7; 
-                font-size: 12pt; 
-                font-family: Arial, sans-serif;
-            }
-            QLabel {
-                color: #333; 
-            }
-            QComboBox, QLineEdit, QPushButton {
-                background: #fff;
-                border: 1px solid #ccc;
-                padding: 6px;
-                border-radius: 4px;
-            }
-            QComboBox QAbstractItemView {
-                background: #fff;
-                border: 1px solid #ccc;
-            }
-            QPushButton {
-                background-color: #CE1000; 
-                color: #fff;
-                font-weight: bold;
-            }
-            QPushButton:hover:enabled {
-                background-color: #B10E00;
-            }
-            QPushButton:disabled {
-                background-color: #ccc;
-                color: #666;
-            }
-            QTableWidget {
-                border: 1px solid #aaa;
-                gridline-color: #ccc;
-                selection-background-color: #CE1000;
-                alternate-background-color: #eaeaea;
-            }
-            QHeaderView::section {
-                background-color: #CE1000;
-                color: #fff;
-                font-weight: bold;
-                padding: 6px;
-                border: none;
-            }
-        """)
-
-    def add_one_year(self, date_str):
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        new_date = date_obj + relativedelta(years=1)
-        return new_date.strftime("%m/%d/%Y")  # Change to MM/DD/YYYY format
+    def create_results_table(self, headers):
+        table = QTableView()
+        table.setModel(TestResultsModel(headers, table))
+        header = table.horizontalHeader()
+        header.setStretchLastSection(True)
+        # Columns stay user-resizable; content fitting only samples the first rows
+        header.setSectionResizeMode(QHeaderView.Interactive)
+        header.setResizeContentsPrecision(RESIZE_SAMPLE_ROWS)
+        table.setEditTriggers(QTableView.NoEditTriggers)
+        table.setSelectionBehavior(QTableView.SelectRows)
+        table.setAlternatingRowColors(True)
+        return table
 
     def search_test_results(self):
+        # Read the modifiers now; Shift may be released before the timer fires
+        if QApplication.keyboardModifiers() & Qt.ShiftModifier:
+            self._force_refresh = True
+        # Restarting the timer coalesces rapid Enter presses and clicks
+        self.search_timer.start()
+
+    def run_search(self):
+        if not self.search_button.isEnabled():
+            # A lookup is already in flight; run this search once it finishes
+            self._search_queued = True
+            self.status_label.setText("Search queued until the current lookup finishes...")
+            return
+
+        # Holding Shift while pressing Enter or clicking Search also bypasses the cache
+        refresh = self.refresh_checkbox.isChecked() or self._force_refresh
+        self._force_refresh = False
+
         license_code = self.license_combo.currentText()
         partial_tag = self.tag_input.text().strip()
 
         if not partial_tag:
-            QMessageBox.warning(self, "Input Error", "Please enter a partial tag.")
+            self.show_input_error("Please enter a partial tag.")
             return
 
-        if not partial_tag.isdigit():
-            QMessageBox.warning(self, "Input Error", "Partial tag must contain only digits.")
+        if not PARTIAL_TAG_PATTERN.fullmatch(partial_tag):
+            self.show_input_error("Partial tag must contain only digits.")
             return
+        self.status_label.setStyleSheet("")
 
-        prefix = PREFIXES.get(license_code)
-        if not prefix:
+        full_label = build_full_label(license_code, partial_tag)
+        if full_label is None:
             QMessageBox.warning(self, "License Error", f"No prefix found for license {license_code}.")
             return
 
-        full_label = prefix + partial_tag
-        self.log_message(f"Full package label constructed: {full_label}")
+        query = (license_code, partial_tag)
+        if not refresh and query == self._last_query and time.monotonic() - self._last_results_time < CACHE_TTL:
+            logger.info("Reusing results for unchanged query: %s", partial_tag)
+            self.show_test_results(*self._last_results)
+            return
+        self._pending_query = query
+
+        logger.info("Full package label constructed: %s", full_label)
         self.status_label.setText("Fetching package details and test results...")
 
         self.progress_bar.setRange(0, 0)
         self.progress_bar.setVisible(True)
+        self.search_button.setEnabled(False)
 
-        self.thread = QThread()
-        self.worker = Worker(license_code, full_label)
-        self.worker.moveToThread(self.thread)
+        worker = Worker(license_code, full_label, refresh)
+        worker.signals.error.connect(self.handle_error)
+        worker.signals.test_results_ready.connect(self.handle_test_results)
+        worker.signals.finished.connect(self.worker_done)
 
-        self.thread.started.connect(self.worker.run)
-        self.worker.error.connect(self.handle_error)
-        self.worker.test_results_ready.connect(self.handle_test_results)
-        self.worker.finished.connect(self.worker_done)
+        self.thread_pool.start(worker)
 
-        self.thread.start()
+    def show_input_error(self, message):
+        # Inline feedback instead of a modal dialog; cleared by the next valid search
+        self.status_label.setStyleSheet("color: #CE1000;")
+        self.status_label.setText(message)
+
+    def resize_result_columns(self):
+        self.cannabinoids_table.resizeColumnsToContents()
+        self.terpenes_table.resizeColumnsToContents()
+
+    def clear_cache(self):
+        invalidate()
+        self._last_query = None
+        self._last_results = None
+        logger.info("Cleared cached METRC lookups")
+        self.status_label.setText("Cache cleared.")
 
     def handle_error(self, error_message, context):
         self.progress_bar.setVisible(False)
-        if error_message == "Unauthorized":
-            QMessageBox.critical(self, "Authentication Error", f"Unauthorized access when fetching {context}. Check API credentials.")
-        elif error_message == "packageId not found":
-            QMessageBox.warning(self, "Not Found", f"Package ID not found when fetching {context}.")
-        else:
-            QMessageBox.warning(self, "API Error", f"Failed to retrieve {context}: {error_message}")
+        self.search_button.setEnabled(True)
+        # The failed query has no results to remember
+        self._pending_query = None
+        show, title, template = ERROR_DIALOGS.get(error_message, DEFAULT_ERROR_DIALOG)
+        show(self, title, template.format(context=context, error=error_message))
         self.status_label.setText(f"Error fetching {context}.")
-        self.thread.quit()
-        self.thread.wait()
-
-    def handle_test_results(self, test_results, package_info):
-        if not test_results:
+        self.run_queued_search()
+
+    def run_queued_search(self):
+        # Start a search the user made while the previous lookup was running
+        if self._search_queued:
+            self._search_queued = False
+            self.search_timer.start()
+
+    def handle_test_results(self, results, package_info):
+        if self._pending_query is not None:
+            self._last_query = self._pending_query
+            self._last_results = (results, package_info)
+            self._last_results_time = time.monotonic()
+            self._pending_query = None
+        self.show_test_results(results, package_info)
+
+    def show_test_results(self, results, package_info):
+        self._results_loaded = results["has_results"]
+        if not results["has_results"]:
             QMessageBox.information(self, "No Results", "No test results found for this package.")
             self.status_label.setText("No test results found.")
-            self.populate_cannabinoids_table([])
-            self.populate_terpenes_table([])
+            self.cannabinoids_table.model().set_rows([])
+            self.terpenes_table.model().set_rows([])
+            self.terpenes_data = []
             self.export_button.setEnabled(False)
         else:
-            self.populate_cannabinoids_table(test_results)
-            self.populate_terpenes_table(test_results)
+            self.cannabinoids_table.model().set_rows(results["cannabinoid_rows"])
+            self.terpenes_table.model().set_rows(results["terpene_rows"])
+            self.terpenes_data = results["terpene_export"]
+            # Fit columns once both tables hold their final rows, after the
+            # rest of this update has been handled by the event loop
+            QTimer.singleShot(0, self.resize_result_columns)
             self.status_label.setText("Test results fetched successfully.")
 
             self.product_name = package_info.get("product_name", "Unknown Product")
             self.source_package_label_value = package_info.get("source_package_label", "N/A")
-            self.test_date = self.extract_test_date(test_results)
+            self.test_date = results["test_date"]
             self.expiration_date = "N/A"
             if self.test_date != "N/A":
-                self.expiration_date = self.add_one_year(self.test_date)
+                self.expiration_date = add_one_year(self.test_date)
 
             self.parse_product_name(self.product_name)
 
             self.expiration_label.setText(f"Expiration Date: {self.expiration_date}")
             self.source_package_label.setText(f"Source Package: {self.source_package_label_value}")
 
-            self.cannabinoid_values = self.extract_cannabinoid_values(test_results)
+            self.cannabinoid_values = results["cannabinoid_values"]
             self.export_button.setEnabled(True)
 
             self.full_package_tag = package_info.get("full_label", "N/A")
@@ -372,28 +762,29 @@ class MetrcApp(QWidget):
         self.strain_name = "N/A"
         self.product_description = "N/A"
 
-        if ':' in product_name:
-            parts = product_name.split(':', 1)
-            self.approval_number = parts[0].strip()
-            rest = parts[1].strip()
+        approval_number, separator, rest = product_name.partition(':')
+        if separator:
+            self.approval_number = approval_number.strip()
+            rest = rest.strip()
         else:
             rest = product_name
 
-        words = rest.split()
-        if len(words) >= 1:
-            self.strain_name = words[-1]
-            if len(words) > 1:
-                self.product_description = " ".join(words[:-1]).strip()
-            else:
-                self.product_description = ""
+        # The strain is the last word; everything before it is the description
+        words = rest.rsplit(None, 1)
+        if len(words) == 2:
+            self.product_description = words[0].strip()
+            self.strain_name = words[1]
+        elif words:
+            self.strain_name = words[0]
+            self.product_description = ""
         else:
             self.strain_name = "N/A"
             self.product_description = rest
 
     def worker_done(self, result):
         self.progress_bar.setVisible(False)
-        self.thread.quit()
-        self.thread.wait()
+        self.search_button.setEnabled(True)
+        self.run_queued_search()
 
     def handle_export_click(self):
         license_code = self.license_combo.currentText()
@@ -413,181 +804,6 @@ class MetrcApp(QWidget):
                 self.product_description,
                 self.strain_name
             )
-            QMessageBox.information(self, "Export Complete", "Data exported to current_results.json.")
-        else:
-            pass
-
-    def log_message(self, message):
-        logging.info(message)
-
-    def extract_test_date(self, results):
-        for r in results:
-            if "TestPerformedDate" in r and r["TestPerformedDate"] != "N/A":
-                date_str = r["TestPerformedDate"]
-                try:
-                    datetime.strptime(date_str, "%Y-%m-%d")
-                    return date_str
-                except ValueError:
-                    return "N/A"
-        return "N/A"
-
-    def add_one_year(self, date_str):
-        date_obj = datetime.strptime(date_str, "%Y-%m-%d")
-        new_date = date_obj + relativedelta(years=1)
-        return new_date.strftime("%m/%d/%Y")  # Change to MM/DD/YYYY format, no timestamp
-
-    def extract_cannabinoid_values(self, results):
-        cannabinoid_values = {cannabinoid: "0.0" for cannabinoid in INDIVIDUAL_CANNABINOIDS}
-        
-        for r in results:
-            test_type = r.get("TestTypeName", "")
-            result_level = r.get("TestResultLevel", "N/A")
-            units = self.extract_units(test_type)
-            
-            if test_type in INDIVIDUAL_CANNABINOIDS:
-                if isinstance(result_level, str):
-                    if result_level.lower() != "n/a":
-                        try:
-                            value = float(result_level)
-                            if value > 0:
-                                cannabinoid_values[test_type] = f"{round(value, 2)}{units}" if units else f"{round(value, 2)}"
-                            else:
-                                cannabinoid_values[test_type] = "0.0"
-                        except ValueError:
-                            cannabinoid_values[test_type] = result_level
-                elif isinstance(result_level, (int, float)):
-                    if result_level > 0:
-                        cannabinoid_values[test_type] = f"{round(result_level, 2)}{units}" if units else f"{round(result_level, 2)}"
-                    else:
-                        cannabinoid_values[test_type] = "0.0"
-                else:
-                    cannabinoid_values[test_type] = "0.0"
-        
-        return cannabinoid_values
-
-    def extract_units(self, test_type):
-        units = ""
-        unit_match = re.search(r"\((.*?)\)", test_type)
-        if unit_match:
-            units = unit_match.group(1)
-        return units
-
-    def populate_cannabinoids_table(self, results):
-        self.cannabinoids_table.setRowCount(0)
-        filtered_results = [
-            result for result in results
-            if isinstance(result, dict) and any(ct in result.get("TestTypeName", "") for ct in CANNABINOID_TEST_TYPES)
-        ]
-        
-        if not filtered_results:
-            self.cannabinoids_table.setRowCount(0)
-            return
-        
-        self.cannabinoids_table.setRowCount(len(filtered_results))
-        
-        for i, result in enumerate(filtered_results):
-            original_test_type = result.get("TestTypeName", "N/A")
-            test_type = self.simplify_cannabinoid_name(original_test_type)
-            
-            status = "Passed" if result.get("TestPassed", False) else "Failed"
-            test_result = result.get("TestResultLevel", "N/A")
-            test_date = result.get("TestPerformedDate", "N/A")
-
-            units = self.extract_units(original_test_type)
-            if units and test_result != "N/A":
-                display_result = f"{test_result} {units}"
-            else:
-                display_result = str(test_result)
-            
-            self.cannabinoids_table.setItem(i, 0, QTableWidgetItem(test_type))
-            self.cannabinoids_table.setItem(i, 1, QTableWidgetItem(status))
-            self.cannabinoids_table.setItem(i, 2, QTableWidgetItem(display_result))
-            self.cannabinoids_table.setItem(i, 3, QTableWidgetItem(test_date))
-        
-        self.cannabinoids_table.resizeColumnsToContents()
-
-    def populate_terpenes_table(self, results):
-        self.terpenes_table.setRowCount(0)
-        filtered_results = [
-            result for result in results
-            if isinstance(result, dict) and any(tt in result.get("TestTypeName", "") for tt in TERPENE_TEST_TYPES)
-        ]
-
-        final_results = []
-        for r in filtered_results:
-            concentration = r.get("TestResultLevel", "N/A")
-            if isinstance(concentration, str):
-                if concentration.lower() != "n/a":
-                    try:
-                        val = float(concentration)
-                        if val == 0.0:
-                            continue  # skip zero values
-                    except ValueError:
-                        pass
-                    final_results.append(r)
-            elif isinstance(concentration, (int, float)):
-                if concentration != 0:
-                    final_results.append(r)
-
-        if not final_results:
-            self.terpenes_table.setRowCount(0)
-            self.terpenes_data = []  # Clear Stored Terpenes Data
-            return
-
-        try:
-            sorted_results = sorted(
-                final_results,
-                key=lambda x: float(x.get("TestResultLevel", 0)) if isinstance(x.get("TestResultLevel", 0), (int, float, str)) and str(x.get("TestResultLevel", 0)).replace('.', '', 1).isdigit() else 0,
-                reverse=True
-            )
-        except ValueError:
-            sorted_results = final_results
-
-        self.terpenes_data = sorted_results
-
-        self.terpenes_table.setRowCount(len(sorted_results))
-        
-        for i, result in enumerate(sorted_results):
-            original_test_type = result.get("TestTypeName", "N/A")
-            units = self.extract_units(original_test_type)
-            
-            display_name = re.sub(r"\(.*?\)", "", original_test_type).strip()
-            display_name = display_name.replace("Mandatory Terpenes", "").strip()
-            display_name = display_name.replace("Alpha-", "a-")
-            display_name = display_name.replace("Beta-", "b-")
-
-            status = "Passed" if result.get("TestPassed", False) else "Failed"
-            concentration = result.get("TestResultLevel", "N/A")
-            test_date = result.get("TestPerformedDate", "N/A")
-
-            if isinstance(concentration, str):
-                if concentration.lower() != "n/a":
-                    try:
-                        # Round the concentration to the nearest hundredth
-                        concentration_display = f"{round(float(concentration), 2)}%"
-                    except ValueError:
-                        concentration_display = str(concentration)
-                else:
-                    concentration_display = str(concentration)
-            elif isinstance(concentration, (int, float)):
-                # Round the concentration to the nearest hundredth
-                concentration_display = f"{round(concentration, 2)}%"
-            else:
-                concentration_display = "N/A"
-            
-            self.terpenes_table.setItem(i, 0, QTableWidgetItem(display_name))
-            self.terpenes_table.setItem(i, 1, QTableWidgetItem(status))
-            self.terpenes_table.setItem(i, 2, QTableWidgetItem(concentration_display))
-            self.terpenes_table.setItem(i, 3, QTableWidgetItem(test_date))
-
-        self.terpenes_table.resizeColumnsToContents()
-
-    def simplify_cannabinoid_name(self, test_type):
-        test_type = test_type.replace("Raw Plant Material & PreRolls", "")
-        test_type = test_type.replace("Mandatory Cannabinoid % and Totals", "")
-        test_type = test_type.replace("Vapes & Concentrates", "")
-        test_type = test_type.replace("Infused Plant Material & PreRolls", "")  # Added line to remove "Infused Plant Material & PreRolls"
-        return test_type.strip()
 
     def export_results_to_json(
         self, product_name, test_date, expiration_date,
@@ -614,62 +830,58 @@ class MetrcApp(QWidget):
             "Terpenes": []  # Will contain a list of terpene details
         }
 
-        # **Add the cannabinoid values to the dictionary**
-        for cannabinoid in INDIVIDUAL_CANNABINOIDS:
-            value = self.cannabinoid_values.get(cannabinoid, "0.0")
-            export_data["Cannabinoids"][cannabinoid] = value
-
-        # **Concatenate Terpenes into a list of dictionaries**
-        if self.terpenes_data:
-            terpenes_list = []
-            for terpene in self.terpenes_data:
-                terpene_name = terpene.get("TestTypeName", "N/A")
-                concentration = terpene.get("TestResultLevel", "N/A")
-                # Clean terpene name and format concentration
-                terpene_name = re.sub(r"\s*\(.*?\)", "", terpene_name).strip()
-                terpene_name = terpene_name.replace("Mandatory Terpenes", "").strip()
-                if isinstance(concentration, str):
-                    if concentration.lower() != "n/a":
-                        try:
-                            concentration = round(float(concentration), 2)  # Round to the nearest hundredth
-                            concentration_display = f"{concentration}%"
-                        except ValueError:
-                            concentration_display = concentration
-                    else:
-                        concentration_display = concentration
-                elif isinstance(concentration, (int, float)):
-                    concentration_display = f"{round(concentration, 2)}%"  # Round to the nearest hundredth
-                else:
-                    concentration_display = "N/A"
-
-                if concentration_display != "N/A":
-                    terpenes_list.append({
-                        "Name": terpene_name,
-                        "Concentration": concentration_display
-                    })
-
-            # Sort terpenes list in descending order of concentration
-            terpenes_list.sort(key=lambda x: float(x["Concentration"].replace('%', '')) if x["Concentration"] != "N/A" else 0, reverse=True)
-            export_data["Terpenes"] = terpenes_list
-        else:
-            export_data["Terpenes"] = "N/A"
-
-        # **Write the data to a JSON file**
-        with open(filename, "w", encoding="utf-8") as jsonfile:
-            json.dump(export_data, jsonfile, ensure_ascii=False, indent=4)
-
-        self.log_message(f"Exported results to {filename}. Bartender can now use this file.")
+        worker = ExportWorker(filename, export_data, dict(self.cannabinoid_values), list(self.terpenes_data))
+        worker.signals.finished.connect(self.export_finished)
+        worker.signals.error.connect(self.export_failed)
+        self.export_button.setEnabled(False)
+        self.thread_pool.start(worker)
+
+    def export_finished(self, result):
+        # A search may have replaced the results while the file was written
+        self.export_button.setEnabled(self._results_loaded)
+        QMessageBox.information(self, "Export Complete", f"Data exported to {result['filename']}.")
+
+    def export_failed(self, error_message, filename):
+        self.export_button.setEnabled(self._results_loaded)
+        QMessageBox.critical(self, "Export Failed", f"Could not write {filename}: {error_message}")
+
+def start_log_listener():
+    """
+    Moves the root logger's handlers behind a queue so log records are written
+    to debug.log and the console by a background thread, not the UI thread.
+    Returns the started listener; stop it before exiting to flush the queue.
+    """
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    log_queue = queue.SimpleQueue()
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+def load_stylesheet(app):
+    """
+    Applies barkeep.qss to the whole application, so Qt parses it once and
+    shares it with every window and dialog.
+    """
+    try:
+        with open(STYLESHEET_PATH, encoding="utf-8") as f:
+            app.setStyleSheet(f.read())
+    except OSError as e:
+        logger.warning("Could not load stylesheet %s: %s", STYLESHEET_PATH, e)
 
 # Main function
 def main():
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    console_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s", "%Y-%m-%d %H:%M:%S")
-    console_handler.setFormatter(console_formatter)
-    logging.getLogger().addHandler(console_handler)
+    configure_logging()
+    log_listener = start_log_listener()
 
-    app = QApplication(sys.argv)
+    # Reuse an existing application (e.g. when launched from a script or shell)
+    app = QApplication.instance() or QApplication(sys.argv)
+    load_stylesheet(app)
     window = MetrcApp()
+    app.aboutToQuit.connect(log_listener.stop)
     window.show()
     sys.exit(app.exec_())
 
@@ -1,32 +1,51 @@
 import os
+import base64
+import dbm
+import json
+import time
+import shelve
+import threading
 import requests
 import logging
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import RotatingFileHandler
-from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
-from tenacity import retry, wait_exponential, stop_after_attempt
+
+try:
+    import orjson  # Optional: faster JSON decoding of METRC responses
+except ImportError:
+    orjson = None
 
 # Load environment variables from .env
 load_dotenv()
 
-# Set up logging to a file called debug.log with rotation
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
 
-# File handler with rotation
-file_handler = RotatingFileHandler("debug.log", maxBytes=5 * 1024 * 1024, backupCount=2)  # 5MB per file
-file_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s", "%Y-%m-%d %H:%M:%S")
-file_handler.setFormatter(file_formatter)
-logger.addHandler(file_handler)
+def configure_logging() -> None:
+    """
+    Sets up logging to a rotating debug.log file (DEBUG) and the console (INFO).
+    Called once by the application at startup rather than on import.
+    """
+    logger.setLevel(logging.DEBUG)
+    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s", "%Y-%m-%d %H:%M:%S")
+
+    # File handler with rotation
+    file_handler = RotatingFileHandler("debug.log", maxBytes=5 * 1024 * 1024, backupCount=2)  # 5MB per file
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
 
-# Console handler
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s", "%Y-%m-%d %H:%M:%S")
-console_handler.setFormatter(console_formatter)
-logger.addHandler(console_handler)
+    # Console handler
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO)
+    console_handler.setFormatter(formatter)
+    logger.addHandler(console_handler)
 
 API_BASE = "https://api-mo.metrc.com"
+PACKAGES_URL = f"{API_BASE}/packages/v2"
+LAB_RESULTS_URL = f"{API_BASE}/labtests/v2/results"
 
 # Retrieve API credentials from environment variables
 API_KEY = os.getenv("VENDOR_API_KEY")
@@ -37,11 +56,24 @@ if not API_KEY or not USER_KEY:
     logger.critical("API_KEY or USER_KEY not set in environment variables.")
     raise EnvironmentError("API credentials are not set.")
 
+# Full response bodies are only written to the debug log when METRC_TRACE_JSON=1
+TRACE_JSON = os.getenv("METRC_TRACE_JSON") == "1"
+
 # Prefix mappings (if applicable)
-PREFIXES = {
+PREFIXES = MappingProxyType({
     "MAN000035": "1A40C03000043950000",
     "CUL000032": "1A40C030000332D0000"
-}
+})
+
+def build_full_label(license_code: str, partial_tag: str):
+    """
+    Returns the full package label for a partial tag under license_code, or
+    None when the license has no known prefix.
+    """
+    prefix = PREFIXES.get(license_code)
+    if not prefix:
+        return None
+    return prefix + partial_tag
 
 # Custom exception for API errors
 class MetrcAPIError(Exception):
@@ -49,63 +81,354 @@ class MetrcAPIError(Exception):
         super().__init__(message)
         self.status_code = status_code
 
+# Shared results for the fixed failure cases, read-only since every caller
+# receives the same object
+_NETWORK_ERROR = MappingProxyType({"success": False, "error": "Network error"})
+_INVALID_JSON_ERROR = MappingProxyType({"success": False, "error": "Invalid JSON response"})
+_PACKAGE_ID_NOT_FOUND_ERROR = MappingProxyType({"success": False, "error": "packageId not found"})
+_UNEXPECTED_JSON_ERROR = MappingProxyType({"success": False, "error": "Unexpected JSON structure"})
+
+# Seconds a successful lookup is reused before METRC is queried again
+CACHE_TTL = 300
+
+# Package details and source labels do not change once a package exists, so
+# they are kept longer than test results, which the lab may still update
+CACHE_TTLS = {
+    "package": 12 * 60 * 60,
+    "source_label": 12 * 60 * 60,
+}
+
+# On-disk copy of the lookup cache so results survive an application restart
+CACHE_FILE = "metrc_cache"
+
+# Most lookups kept in memory; the least recently used entry is evicted first
+CACHE_MAX_ENTRIES = 128
+
+# Maps a lookup key to (expires_at, value); shared by the worker threads.
+# Expiry uses wall-clock time so entries read back from disk stay comparable.
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Serializes access to the cache file, which is not safe to share between
+# threads. Kept apart from _cache_lock so disk I/O never blocks memory lookups.
+_shelf_lock = threading.Lock()
+_shelf_pruned = False
+
+def _remember(store: dict, key: tuple, entry: tuple) -> None:
+    """
+    Stores entry in store as the most recently used key, evicting the oldest
+    entries beyond CACHE_MAX_ENTRIES. Caller must hold _cache_lock.
+    """
+    store.pop(key, None)
+    store[key] = entry
+    while len(store) > CACHE_MAX_ENTRIES:
+        del store[next(iter(store))]
+
+def _open_shelf():
+    """
+    Opens the cache file, dropping expired or unreadable entries the first
+    time it is opened in this session. Caller must hold _shelf_lock.
+    """
+    global _shelf_pruned
+    shelf = shelve.open(CACHE_FILE)
+    if not _shelf_pruned:
+        _shelf_pruned = True
+        now = time.time()
+        for shelf_key in list(shelf.keys()):
+            try:
+                expired = shelf[shelf_key][0] <= now
+            except Exception:  # Written by an older version or truncated
+                expired = True
+            if expired:
+                del shelf[shelf_key]
+    return shelf
+
+def _cache_get(key: tuple):
+    """
+    Returns the cached value for key, or None if it is missing or expired.
+    Falls back to the on-disk cache when the entry is not in memory.
+    """
+    with _cache_lock:
+        entry = _cache.get(key)
+    if entry is None:
+        with _shelf_lock:
+            try:
+                with _open_shelf() as shelf:
+                    entry = shelf.get(repr(key))
+            except dbm.error as e:  # A tuple that already includes OSError
+                logger.warning("Could not read cache file %s: %s", CACHE_FILE, e)
+        if entry is None:
+            return None
+    expires_at, value = entry
+    with _cache_lock:
+        if expires_at <= time.time():
+            _cache.pop(key, None)
+            return None
+        _remember(_cache, key, entry)
+    return value
+
+def _cache_put(key: tuple, value) -> None:
+    """
+    Stores value under key, in memory and on disk, for the TTL configured for
+    its kind (the first element of key) in CACHE_TTLS, or CACHE_TTL.
+    """
+    entry = (time.time() + CACHE_TTLS.get(key[0], CACHE_TTL), value)
+    with _cache_lock:
+        _remember(_cache, key, entry)
+    with _shelf_lock:
+        try:
+            with _open_shelf() as shelf:
+                shelf[repr(key)] = entry
+        except dbm.error as e:
+            logger.warning("Could not write cache file %s: %s", CACHE_FILE, e)
+
+def invalidate(license_code: str = None, full_label: str = None) -> None:
+    """
+    Drops cached lookups so the next search goes to METRC.
+
+    With no arguments the whole cache, in memory and on disk, is cleared.
+    Given a license code and full label, only that package and its test
+    results are dropped. The in-memory cache is cleared even when the cache
+    file cannot be opened.
+    """
+    package_id = None
+    with _cache_lock:
+        if full_label is None:
+            _cache.clear()
+            _validators.clear()
+            _package_ids.clear()
+        else:
+            package_key = ("package", license_code, full_label)
+            entry = _cache.pop(package_key, None)
+            package_id = _package_ids.pop((license_code, full_label), None)
+            if package_id is None and entry is not None:
+                package_id = entry[1].get("package_id")
+            _validators.pop((f"{PACKAGES_URL}/{full_label}", (("licenseNumber", license_code),)), None)
+
+    with _shelf_lock:
+        try:
+            with _open_shelf() as shelf:
+                if full_label is None:
+                    shelf.clear()
+                    return
+                stored = shelf.pop(repr(package_key), None)
+                if package_id is None and stored is not None:
+                    package_id = stored[1].get("package_id")
+                if package_id is not None:
+                    shelf.pop(repr(("test_results", license_code, package_id)), None)
+        except dbm.error as e:
+            logger.warning("Could not update cache file %s: %s", CACHE_FILE, e)
+
+    if package_id is not None:
+        with _cache_lock:
+            _cache.pop(("test_results", license_code, package_id), None)
+            for request_key in [k for k in _validators if k[0] == LAB_RESULTS_URL
+                                and ("packageId", package_id) in k[1]
+                                and ("licenseNumber", license_code) in k[1]]:
+                del _validators[request_key]
+
+# Package ids never change for a given label, so they are kept for the whole
+# session (unlike the TTL cache) to let callers start follow-up requests early
+_package_ids = {}
+
+def known_package_id(license_code: str, full_label: str):
+    """
+    Returns the package id previously resolved for this label, or None.
+    """
+    with _cache_lock:
+        return _package_ids.get((license_code, full_label))
+
+# Requests per second allowed for each license before METRC starts rate limiting
+RATE_LIMIT_PER_SECOND = 25
+
+class TokenBucket:
+    """
+    Thread-safe token bucket; acquire() blocks until a request may be sent.
+    """
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0
+            # Claim the token now so concurrent callers queue up behind this one
+            self.tokens -= 1
+        if wait:
+            time.sleep(wait)
+
+# One bucket per license, since METRC applies its limits per license
+_rate_limiters = {}
+
+def _rate_limiter(license_code: str) -> TokenBucket:
+    """
+    Returns the token bucket for license_code, creating it on first use.
+    """
+    with _cache_lock:
+        bucket = _rate_limiters.get(license_code)
+        if bucket is None:
+            bucket = _rate_limiters[license_code] = TokenBucket(RATE_LIMIT_PER_SECOND, RATE_LIMIT_PER_SECOND)
+        return bucket
+
+# (ETag, Last-Modified, body) of the last successful response per request that
+# carried either header, so the next request can be sent as a conditional GET.
+# Bounded like _cache, least recently used first.
+_validators = {}
+
+# Largest pageSize METRC accepts for v2 list endpoints; larger values are rejected
+MAX_PAGE_SIZE = 20
+
+# Most package lookups run at once; the UI caps its thread pool to match
+MAX_LOOKUP_THREADS = 4
+
+# Most test result pages fetched at once for a single package
+PAGE_FETCH_WORKERS = 8
+
+# (connect, read) timeouts in seconds; a dead host fails fast, a slow query may finish
+REQUEST_TIMEOUT = (3, 10)
+
 # Initialize a session for connection pooling
 session = requests.Session()
-session.auth = HTTPBasicAuth(API_KEY, USER_KEY)
-
-@retry(wait=wait_exponential(multiplier=1, min=4, max=10), stop=stop_after_attempt(5))
-def make_api_request(endpoint: str, params: dict = None) -> requests.Response:
+# The Basic credentials never change, so the header is encoded once up front
+session.headers["Authorization"] = "Basic " + base64.b64encode(f"{API_KEY}:{USER_KEY}".encode()).decode()
+# requests already asks for gzip and keeps connections alive; only JSON is expected back
+session.headers["Accept"] = "application/json"
+# Only one host is used, so a single per-host pool is needed. Requests come
+# from up to MAX_LOOKUP_THREADS lookup threads plus as many prefetch threads;
+# each of those has at most one request of its own in flight, or blocks while
+# up to PAGE_FETCH_WORKERS test result pages are fetched for it, so the pool
+# holds a connection for every request that can be in flight at once
+# Transient connection failures, rate limiting and server errors are retried at
+# the transport level, waiting as long as METRC asks to via Retry-After
+session.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=2 * MAX_LOOKUP_THREADS * PAGE_FETCH_WORKERS,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(["GET"]),  # Only idempotent reads are ever retried
+        respect_retry_after_header=True,
+        raise_on_status=False,  # Hand back the last reply so its status can be reported
+    ),
+))
+
+def make_api_request(endpoint: str, params: dict = None) -> bytes:
     """
-    Make a GET API request with retry logic.
-    Retries on failures (network-related issues) with exponential backoff.
+    Make a GET API request through the shared session.
+    Connection failures, rate limiting and server errors are retried with
+    exponential backoff by the session's HTTPAdapter.
+    Repeated requests are sent as conditional GETs; a 304 Not Modified reply
+    returns the previously stored body without downloading it again.
+    Requests are throttled per license to stay under METRC's rate limit.
 
     Parameters:
         endpoint (str): The API endpoint URL.
         params (dict, optional): Query parameters for the GET request.
 
     Returns:
-        requests.Response: The response object.
+        bytes: The response body.
 
     Raises:
         requests.RequestException: If the request fails after retries.
+        MetrcAPIError: If METRC answers with an HTTP error status.
     """
+    request_key = (endpoint, tuple(sorted(params.items())) if params else ())
+    with _cache_lock:
+        previous = _validators.get(request_key)
+        if previous is not None:
+            _remember(_validators, request_key, previous)
+
+    headers = {}
+    if previous is not None:
+        etag, last_modified, _ = previous
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    _rate_limiter(params.get("licenseNumber") if params else None).acquire()
+
     try:
         logger.debug("Making GET request to endpoint: %s with params: %s", endpoint, params)
-        response = session.get(endpoint, params=params, timeout=10)  # Added timeout for better control
-        response.raise_for_status()
-        logger.debug("Received response with status code: %s", response.status_code)
-        return response
+        response = session.get(endpoint, params=params, headers=headers, timeout=REQUEST_TIMEOUT)
+        status = response.status_code
+        if status == 304 and previous is not None:
+            logger.debug("Not modified, reusing stored response for %s", endpoint)
+            return previous[2]
+        if status >= 400:
+            # Retriable statuses were already retried by the adapter
+            logger.error("GET request to %s returned HTTP %d", endpoint, status)
+            raise MetrcAPIError("Unauthorized" if status in (401, 403) else f"HTTP {status}", status)
+        logger.debug("Received response with status code: %s", status)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            with _cache_lock:
+                _remember(_validators, request_key, (etag, last_modified, response.content))
+        return response.content
     except requests.RequestException as e:
         logger.error("GET request to %s failed: %s", endpoint, str(e))
-        raise e
+        raise
+
+# Only the start of an unparseable body is logged; it is enough to tell an
+# HTML error page from truncated JSON without flooding debug.log
+ERROR_BODY_LOG_BYTES = 1024
 
-def get_package_id(license_code: str, full_label: str) -> dict:
+def parse_json(body: bytes):
+    """
+    Decodes a JSON response body, using orjson when it is installed.
+
+    Raises:
+        ValueError: If the body is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+def get_package_id(license_code: str, full_label: str, refresh: bool = False) -> dict:
     """
     Fetches package details based on license number and package label.
 
     Parameters:
         license_code (str): The license number.
         full_label (str): The full label of the package.
+        refresh (bool, optional): Bypass the in-memory cache. Defaults to False.
 
     Returns:
         dict: Contains success status and package details or error message.
     """
-    endpoint = f"{API_BASE}/packages/v2/{full_label}"
+    cache_key = ("package", license_code, full_label)
+    cached = None if refresh else _cache_get(cache_key)
+    if cached is not None:
+        logger.info("Using cached package details for label=%s", full_label)
+        return cached
+
+    endpoint = f"{PACKAGES_URL}/{full_label}"
     params = {"licenseNumber": license_code}
     logger.info("Requesting package details from: %s with params: %s", endpoint, params)
 
     try:
-        response = make_api_request(endpoint, params=params)
+        body = make_api_request(endpoint, params=params)
     except requests.RequestException as e:
         logger.exception("Network error while contacting Metrc API for package details: %s", e)
-        return {"success": False, "error": "Network error"}
+        return _NETWORK_ERROR
+    except MetrcAPIError as e:
+        return {"success": False, "error": str(e)}
 
     try:
-        package_data = response.json()
-        logger.debug("Package Data JSON: %s", package_data)
+        package_data = parse_json(body)
+        if TRACE_JSON and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Package Data JSON: %s", package_data)
     except ValueError:
-        logger.error("Invalid JSON response for packageLabel=%s: %s", full_label, response.text)
-        return {"success": False, "error": "Invalid JSON response"}
+        logger.error("Invalid JSON response for packageLabel=%s: %r", full_label, body[:ERROR_BODY_LOG_BYTES])
+        return _INVALID_JSON_ERROR
 
     if isinstance(package_data, dict):
         package_id = package_data.get("Id")
@@ -117,11 +440,11 @@ def get_package_id(license_code: str, full_label: str) -> dict:
 
         # If we have a source package id but no label, fetch it
         if not source_package_label and source_package_id:
-            source_package_label = get_source_package_label(license_code, source_package_id)
+            source_package_label = get_source_package_label(license_code, source_package_id, refresh=refresh)
 
         if package_id:
             logger.debug("Found packageId=%s for label=%s", package_id, full_label)
-            return {
+            result = {
                 "success": True,
                 "package_id": package_id,
                 "product_name": product_name,
@@ -129,95 +452,190 @@ def get_package_id(license_code: str, full_label: str) -> dict:
                 "number_of_doses": number_of_doses,
                 "ingredients_list": ingredients_list
             }
+            _cache_put(cache_key, result)
+            with _cache_lock:
+                _package_ids[(license_code, full_label)] = package_id
+            return result
         else:
             logger.error("packageId not found in the response for label=%s", full_label)
-            return {"success": False, "error": "packageId not found"}
+            return _PACKAGE_ID_NOT_FOUND_ERROR
     else:
         logger.error("Unexpected JSON structure for package details: %s", package_data)
-        return {"success": False, "error": "Unexpected JSON structure"}
+        return _UNEXPECTED_JSON_ERROR
 
-def get_source_package_label(license_code: str, source_package_id: int) -> str:
+def get_source_package_label(license_code: str, source_package_id: int, refresh: bool = False) -> str:
     """
     Retrieves the label of a source package given its ID.
 
     Parameters:
         license_code (str): The license number.
         source_package_id (int): The ID of the source package.
+        refresh (bool, optional): Bypass the in-memory cache. Defaults to False.
 
     Returns:
         str: The label of the source package or "N/A" if not found.
     """
-    endpoint = f"{API_BASE}/packages/v2/{source_package_id}"
+    # Sibling packages often share a source package, so its label is cached too.
+    # The id is normalized so "123", " 123" and 123 share an entry.
+    cache_key = ("source_label", license_code, str(source_package_id).strip())
+    cached = None if refresh else _cache_get(cache_key)
+    if cached is not None:
+        logger.info("Using cached source package label for sourcePackageId=%s", source_package_id)
+        return cached
+
+    endpoint = f"{PACKAGES_URL}/{source_package_id}"
     params = {"licenseNumber": license_code}
     logger.info("Requesting source package details from: %s with params: %s", endpoint, params)
 
     try:
-        response = make_api_request(endpoint, params=params)
+        body = make_api_request(endpoint, params=params)
     except requests.RequestException as e:
         logger.exception("Network error while contacting Metrc API for source package details: %s", e)
         return "N/A"
+    except MetrcAPIError:
+        return "N/A"
 
     try:
-        data = response.json()
+        data = parse_json(body)
         label = data.get("Label", "N/A")
         logger.debug("Source package label: %s", label)
+        if label != "N/A":
+            _cache_put(cache_key, label)
         return label
     except ValueError:
-        logger.error("Invalid JSON when fetching source package: %s", response.text)
+        logger.error("Invalid JSON when fetching source package: %r", body[:ERROR_BODY_LOG_BYTES])
         return "N/A"
 
-def get_test_results(license_code: str, package_id: int, page_size: int = 20) -> dict:
+def _fetch_test_results_page(base_params: dict, page_number: int) -> dict:
+    """
+    Fetches a single page of lab test results. base_params holds the query
+    shared by every page; it is copied because pages are fetched concurrently.
+
+    Returns:
+        dict: Contains success status, the page's records and the total page
+        count, or an error message.
+    """
+    endpoint = LAB_RESULTS_URL
+    params = dict(base_params, pageNumber=page_number)
+    logger.info("Requesting test results from: %s with params: %s", endpoint, params)
+
+    try:
+        body = make_api_request(endpoint, params=params)
+    except requests.RequestException as e:
+        logger.exception("Network error while contacting Metrc API for test results: %s", e)
+        return _NETWORK_ERROR
+    except MetrcAPIError as e:
+        return {"success": False, "error": str(e)}
+
+    try:
+        test_results = parse_json(body)
+        if TRACE_JSON and logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Test Results JSON: %s", test_results)
+    except ValueError:
+        logger.error("Invalid JSON response for packageId=%s: %r", params["packageId"], body[:ERROR_BODY_LOG_BYTES])
+        return _INVALID_JSON_ERROR
+
+    if isinstance(test_results, dict):
+        data = test_results.get("Data", [])
+        total_pages = test_results.get("TotalPages", 1)
+    elif isinstance(test_results, list):
+        data = test_results
+        total_pages = 1
+    else:
+        logger.error("Unexpected JSON structure for test results: %s", test_results)
+        return _UNEXPECTED_JSON_ERROR
+
+    logger.info("Fetched page %d/%d with %d test results.", page_number, total_pages, len(data))
+    return {"success": True, "data": data, "total_pages": total_pages}
+
+def get_test_results(license_code: str, package_id: int, page_size: int = MAX_PAGE_SIZE, refresh: bool = False) -> dict:
     """
     Fetches lab test results associated with a specific package.
 
     Parameters:
         license_code (str): The license number.
         package_id (int): The ID of the package.
-        page_size (int, optional): Number of records per page. Defaults to 20.
+        page_size (int, optional): Number of records per page, capped at
+            MAX_PAGE_SIZE. Defaults to MAX_PAGE_SIZE.
+        refresh (bool, optional): Bypass the in-memory cache. Defaults to False.
 
     Returns:
         dict: Contains success status and test results data or error message.
     """
-    all_test_results = []
-    page_number = 1
-    total_pages = 1
+    cache_key = ("test_results", license_code, package_id)
+    cached = None if refresh else _cache_get(cache_key)
+    if cached is not None:
+        logger.info("Using cached test results for packageId=%s", package_id)
+        return cached
+
+    base_params = {
+        "licenseNumber": license_code,
+        "packageId": package_id,
+        "pageSize": min(page_size, MAX_PAGE_SIZE)
+    }
+    first_page = _fetch_test_results_page(base_params, 1)
+    if not first_page["success"]:
+        return first_page
+
+    total_pages = first_page["total_pages"]
+    if total_pages <= 1 or len(first_page["data"]) < base_params["pageSize"]:
+        # Most packages fit on one page; no executor is needed. A short first
+        # page also means there is nothing more, whatever TotalPages claims.
+        all_test_results = first_page["data"]
+    else:
+        # Later pages only depend on the page count, so they are fetched concurrently
+        all_test_results = list(first_page["data"])
+        with ThreadPoolExecutor(max_workers=min(PAGE_FETCH_WORKERS, total_pages - 1)) as executor:
+            futures = [
+                executor.submit(_fetch_test_results_page, base_params, page_number)
+                for page_number in range(2, total_pages + 1)
+            ]
+            for future in futures:
+                page = future.result()
+                if not page["success"]:
+                    return page
+                all_test_results.extend(page["data"])
 
-    while page_number <= total_pages:
-        endpoint = f"{API_BASE}/labtests/v2/results"
-        params = {
-            "licenseNumber": license_code,
-            "packageId": package_id,
-            "pageNumber": page_number,
-            "pageSize": page_size
-        }
-        logger.info("Requesting test results from: %s with params: %s", endpoint, params)
+    logger.info("Total test results fetched: %d", len(all_test_results))
+    result = {"success": True, "data": all_test_results}
+    _cache_put(cache_key, result)
+    return result
 
-        try:
-            response = make_api_request(endpoint, params=params)
-        except requests.RequestException as e:
-            logger.exception("Network error while contacting Metrc API for test results: %s", e)
-            return {"success": False, "error": "Network error"}
+# Runs test result requests that overlap a package details request
+_prefetch_executor = ThreadPoolExecutor(max_workers=MAX_LOOKUP_THREADS, thread_name_prefix="metrc-prefetch")
 
-        try:
-            test_results = response.json()
-            logger.debug("Test Results JSON: %s", test_results)
-        except ValueError:
-            logger.error("Invalid JSON response for packageId=%s: %s", package_id, response.text)
-            return {"success": False, "error": "Invalid JSON response"}
-
-        if isinstance(test_results, dict):
-            data = test_results.get("Data", [])
-            all_test_results.extend(data)
-            total_pages = test_results.get("TotalPages", 1)
-        elif isinstance(test_results, list):
-            all_test_results.extend(test_results)
-            total_pages = 1
-        else:
-            logger.error("Unexpected JSON structure for test results: %s", test_results)
-            return {"success": False, "error": "Unexpected JSON structure"}
+def get_package_with_tests(license_code: str, full_label: str, refresh: bool = False) -> dict:
+    """
+    Fetches package details and the package's lab test results in one call.
 
-        logger.info("Fetched page %d/%d with %d test results.", page_number, total_pages, len(data))
-        page_number += 1
+    When the label has been resolved before, its test results are requested
+    while the package details are refreshed instead of after them.
 
-    logger.info("Total test results fetched: %d", len(all_test_results))
-    return {"success": True, "data": all_test_results}
+    Parameters:
+        license_code (str): The license number.
+        full_label (str): The full label of the package.
+        refresh (bool, optional): Bypass the in-memory cache. Defaults to False.
+
+    Returns:
+        dict: On success, the "package" and "test_results" responses. On
+        failure, the failing response with "failed" set to "package" or
+        "test_results".
+    """
+    known_id = known_package_id(license_code, full_label)
+    prefetch = None
+    if known_id is not None:
+        prefetch = _prefetch_executor.submit(get_test_results, license_code, known_id, refresh=refresh)
+
+    package_response = get_package_id(license_code, full_label, refresh=refresh)
+    if not package_response["success"]:
+        return dict(package_response, failed="package")
+
+    package_id = package_response["package_id"]
+    if prefetch is not None and package_id == known_id:
+        test_response = prefetch.result()
+    else:
+        test_response = get_test_results(license_code, package_id, refresh=refresh)
+    if not test_response["success"]:
+        return dict(test_response, failed="test_results")
+
+    return {"success": True, "package": package_response, "test_results": test_response}